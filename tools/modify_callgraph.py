@@ -2,38 +2,37 @@
 
 import argparse
 import os
+import shutil
 import subprocess
 import sys
 from pathlib import Path
 
+from pyflamegraph import load_folded
 
-def find_gprof2dot() -> str:
-    """Locate gprof2dot.py script."""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    gprof2dot_path = os.path.join(script_dir, "gprof2dot", "gprof2dot.py")
-    
-    if not os.path.exists(gprof2dot_path):
-        print(f"Error: gprof2dot.py not found at: {gprof2dot_path}", file=sys.stderr)
-        print("Please ensure gprof2dot is installed in tools/gprof2dot/", file=sys.stderr)
-        sys.exit(1)
-    
-    return gprof2dot_path
 
-
-def run_command(cmd: list, description: str):
-    """Execute a command and handle errors."""
+def run_command(cmd: list, description: str, input_data: bytes = None,
+                capture_stderr: bool = True):
+    """Execute a command and handle errors.
+    
+    The program is resolved to an absolute path and fds are inherited
+    (close_fds=False) so that subprocess can use posix_spawn instead of
+    fork+exec. stdout is discarded; only stderr is kept (as raw bytes) for
+    the error report.
+    """
     try:
         result = subprocess.run(
-            cmd,
+            [shutil.which(cmd[0]) or cmd[0]] + cmd[1:],
+            input=input_data,
             check=True,
-            capture_output=True,
-            text=True
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE if capture_stderr else None,
+            close_fds=False
         )
         return result
     except subprocess.CalledProcessError as e:
         print(f"Error during {description}:", file=sys.stderr)
         if e.stderr:
-            print(e.stderr, file=sys.stderr)
+            print(e.stderr.decode("utf-8", "replace"), file=sys.stderr)
         raise
     except FileNotFoundError as e:
         print(f"Error: Command not found - {cmd[0]}", file=sys.stderr)
@@ -44,33 +43,66 @@ def run_command(cmd: list, description: str):
         raise
 
 
-def generate_dot_file(input_file: str, output_file: str, gprof2dot_path: str):
-    """Generate DOT file from folded callstack using gprof2dot."""
-    cmd = [
-        "python3",
-        gprof2dot_path,
-        "-f", "collapse",  # Input format: folded/collapsed stack
-        "-o", output_file,
-        input_file
+def _dot_escape(name: str) -> str:
+    return name.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def fold_to_dot(input_file: str, prune: float = 0.0) -> bytes:
+    """Build the call tree of a folded callstack and return it as DOT.
+    
+    Each line looks like "_start;main;Proc0; 80000018": the stack frames
+    separated by ';' followed by the sample count. Subtrees holding less
+    than `prune` (a fraction of all samples) are folded into "<pruned>".
+    """
+    tree = load_folded(input_file)
+    if prune > 0:
+        tree.prune(prune * tree.total[0])
+    
+    total = tree.total[0] or 1
+    parts = [
+        "digraph {\n",
+        "\tgraph [fontname=Arial, nodesep=0.125, ranksep=0.25];\n",
+        "\tnode [fontname=Arial, shape=box, style=filled, "
+        "fillcolor=\"#ffd8b0\"];\n",
+        "\tedge [fontname=Arial];\n",
     ]
     
-    print(f"Generating DOT file: {output_file}")
-    run_command(cmd, "gprof2dot execution")
-    print(f"✓ DOT file created: {output_file}")
+    # Tree nodes are numbered by their FrameTree index
+    stack = tree.children(0)
+    while stack:
+        node = stack.pop()
+        node_total = tree.total[node]
+        pct = 100.0 * node_total / total
+        parts.append(
+            f'\t"n{node}" [label="{_dot_escape(tree.name(node))}\\n'
+            f'{node_total} ({pct:.1f}%)"];\n'
+        )
+        parent = tree.parent[node]
+        if parent > 0:
+            parts.append(
+                f'\t"n{parent}" -> "n{node}" [label="{node_total}"];\n'
+            )
+        stack.extend(tree.children(node))
+    parts.append("}\n")
+    
+    return "".join(parts).encode("utf-8")
 
 
-def render_graph(dot_file: str, output_format: str, output_file: str):
-    """Render DOT file to specified format using Graphviz."""
-    cmd = [
-        "dot",
-        f"-T{output_format}",
-        dot_file,
-        "-o", output_file
-    ]
+def render_graph(dot_data: bytes, outputs: list):
+    """Render DOT graph piped on stdin to several formats in one dot run.
+    
+    `outputs` holds (format, output_file) pairs; dot pairs each -T with the
+    -o that follows it, so the graph is parsed and laid out only once.
+    """
+    cmd = ["dot"]
+    for output_format, output_file in outputs:
+        cmd.extend([f"-T{output_format}", "-o", output_file])
+        print(f"Rendering {output_format.upper()}: {output_file}")
     
-    print(f"Rendering {output_format.upper()}: {output_file}")
-    run_command(cmd, f"dot rendering to {output_format}")
-    print(f"✓ {output_format.upper()} created: {output_file}")
+    formats = ", ".join(fmt for fmt, _ in outputs)
+    run_command(cmd, f"dot rendering to {formats}", dot_data)
+    for output_format, output_file in outputs:
+        print(f"✓ {output_format.upper()} created: {output_file}")
 
 
 def auto_generate_output_path(input_path: str) -> str:
@@ -84,15 +116,8 @@ def auto_generate_output_path(input_path: str) -> str:
     base_name = input_pathobj.stem
     
     # Try to extract type from "folded_XXX" pattern
-    if "folded_" in base_name:
-        parts = base_name.split("folded_", 1)
-        if len(parts) == 2:
-            stack_type = parts[1]
-            output_name = f"call_graph_{stack_type}.dot"
-        else:
-            output_name = f"call_graph_{base_name}.dot"
-    else:
-        output_name = f"call_graph_{base_name}.dot"
+    _, sep, stack_type = base_name.partition("folded_")
+    output_name = f"call_graph_{stack_type if sep else base_name}.dot"
     
     # Place in same directory as input
     output_path = input_pathobj.parent / output_name
@@ -119,8 +144,8 @@ Examples:
   %(prog)s trace.txt -o output/graph.dot --svg
 
 Note:
-  This script uses gprof2dot.py (LGPL v3) and Graphviz dot for rendering.
-  Make sure both are available in your system.
+  The call graph is built directly from the folded stacks; Graphviz dot
+  is only needed when rendering SVG/PNG/PDF output.
         """
     )
     
@@ -147,6 +172,13 @@ Note:
         action="store_true",
         help="Also generate PDF output"
     )
+    parser.add_argument(
+        "--prune",
+        type=float,
+        default=0.001,
+        help="Fold subtrees below this fraction of all samples into a "
+             "<pruned> node (default: 0.001, 0 disables)"
+    )
     
     return parser.parse_args()
 
@@ -160,9 +192,6 @@ def main():
         print(f"Error: Input file not found: {args.input}", file=sys.stderr)
         sys.exit(1)
     
-    # Locate gprof2dot
-    gprof2dot_path = find_gprof2dot()
-    
     # Determine output path
     if args.output:
         dot_output = args.output
@@ -174,17 +203,19 @@ def main():
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
     
-    # Generate DOT file using gprof2dot
-    generate_dot_file(args.input, dot_output, gprof2dot_path)
+    # Build the call tree once and keep the DOT text in memory
+    print(f"Generating DOT file: {dot_output}")
+    dot_data = fold_to_dot(args.input, args.prune)
+    Path(dot_output).write_bytes(dot_data)
+    print(f"✓ DOT file created: {dot_output}")
     
-    # Render to additional formats if requested
+    # Render to additional formats if requested, all in one dot process
     dot_path_obj = Path(dot_output)
-    formats_to_render = []
+    outputs = [(fmt, str(dot_path_obj.with_suffix(f".{fmt}")))
+               for fmt in ["svg", "png", "pdf"] if getattr(args, fmt)]
     
-    for fmt in ["svg", "png", "pdf"]:
-        if getattr(args, fmt):
-            output_file = str(dot_path_obj.with_suffix(f".{fmt}"))
-            render_graph(dot_output, fmt, output_file)
+    if outputs:
+        render_graph(dot_data, outputs)
     
     print("\n✓ All done!")
 
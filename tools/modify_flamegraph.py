@@ -3,9 +3,18 @@
 import os
 import sys
 import argparse
+import copy
+import functools
+import gzip
+import hashlib
+import shutil
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import BinaryIO, Optional, List, Dict, Tuple
+
+from pyflamegraph import (compile_rect_emitter, dump_folded, emit_svg,
+                          read_folded)
 
 
 class FlameGraphConfig:
@@ -25,6 +34,8 @@ class FlameGraphConfig:
         self.minwidth: str = '0.1'
         self.reverse: bool = False
         self.inverted: bool = False
+        self.prune: float = 0.0
+        self.compress: bool = False
     
     def to_args(self) -> List[str]:
         """Convert config to flamegraph.pl command line arguments."""
@@ -46,46 +57,140 @@ class FlameGraphConfig:
             args.append('--inverted')
         
         return args
+    
+    def compile_emitter(self):
+        """Return the native SVG rect emitter specialized for this config.
+        
+        The generated function is cached per (height, color), so batch
+        runs with one config compile it only once.
+        """
+        return compile_rect_emitter(self.height, self.color)
+
+
+def prune_folded(stacks: BinaryIO, prune: float) -> bytes:
+    """Drop stacks below a fraction of all samples from a folded file.
+    
+    Samples of the dropped subtrees are kept as one '<pruned>' stack per
+    parent frame, so the total sample count stays unchanged.
+    """
+    tree = read_folded(stacks)
+    tree.prune(prune * tree.total[0])
+    return dump_folded(tree)
+
+
+@functools.lru_cache(maxsize=4096)
+def detect_benchmark(input_path: str) -> str:
+    """Benchmark name from the output directory, or 'unknown'."""
+    parent = Path(input_path).parent.name
+    
+    # e.g., out_dhrystone -> dhrystone
+    if parent.startswith('out_'):
+        return parent[len('out_'):]
+    return 'unknown'
+
+
+@functools.lru_cache(maxsize=4096)
+def detect_trace_type(input_path: str) -> str:
+    """Trace type from the file name, or 'unknown'."""
+    stem = Path(input_path).stem  # filename without extension
+    
+    # e.g., callstack_folded_inst -> inst
+    _, sep, rest = stem.partition('folded_')
+    trace_type = rest.partition('_')[0]
+    return trace_type if sep and trace_type else 'unknown'
+
+
+def auto_detect_metadata(input_path: str) -> Dict[str, str]:
+    """Auto-detect benchmark name and type from path."""
+    return {
+        'benchmark': detect_benchmark(input_path),
+        'trace_type': detect_trace_type(input_path)
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def auto_output_path(input_path: str) -> str:
+    """Default SVG path next to the input, named after the trace type."""
+    output_name = f"flamegraph_{detect_trace_type(input_path)}.svg"
+    return str(Path(input_path).parent / output_name)
+
+
+def _write_output(output: str, svg: bytes, compress: bool):
+    """Write SVG bytes, gzip-compressed (.svgz) if requested."""
+    if compress:
+        with gzip.open(output, 'wb', compresslevel=6) as f:
+            f.write(svg)
+    else:
+        with open(output, 'wb') as f:
+            f.write(svg)
+
+
+# Renderer hashed into cache keys when flamegraph.pl is not used
+_NATIVE_BACKEND = str(Path(__file__).with_name('pyflamegraph.py'))
+
+
+def default_cache_dir() -> Path:
+    """Per-user flame graph cache, honouring XDG_CACHE_HOME."""
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'rv32emu-flamegraph'
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    """Hash of a renderer script; stat fields key the memo so edits show."""
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read()).hexdigest()
+
+
+def _backend_digest(backend: str) -> str:
+    st = os.stat(backend)
+    return _file_digest(backend, st.st_mtime_ns, st.st_size)
+
+
+def _cache_key(stacks: BinaryIO, backend: str,
+               config: FlameGraphConfig) -> str:
+    """Hash the folded input together with everything affecting the SVG.
+
+    `backend` is the renderer script (flamegraph.pl or pyflamegraph.py);
+    its contents are part of the key, so upgrading it invalidates entries.
+    """
+    if hasattr(hashlib, 'file_digest'):
+        digest = hashlib.file_digest(stacks, 'blake2b')
+    else:
+        digest = hashlib.blake2b()
+        for chunk in iter(lambda: stacks.read(1 << 20), b''):
+            digest.update(chunk)
+    stacks.seek(0)
+    digest.update(repr((_backend_digest(backend), config.to_args(),
+                        config.prune)).encode())
+    return digest.hexdigest()
+
+
+def _store_cached(output: str, cached: Path):
+    """Copy a fresh output into the cache; rename keeps it atomic."""
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    shutil.copyfile(output, tmp)
+    os.replace(tmp, cached)
 
 
 class FlameGraphWrapper:
-    """Wrapper for flamegraph.pl with enhanced features."""
+    """Wrapper for flamegraph.pl with enhanced features.
     
-    def __init__(self, flamegraph_pl_path: str):
+    Without a flamegraph.pl path the SVG is rendered by the native
+    emitter in pyflamegraph.py.
+    """
+    
+    def __init__(self, flamegraph_pl_path: Optional[str] = None,
+                 use_numba: bool = False,
+                 cache_dir: Optional[Path] = None):
         self.flamegraph_pl = flamegraph_pl_path
-        if not os.path.exists(self.flamegraph_pl):
+        self.use_numba = use_numba
+        self.cache_dir = cache_dir
+        if self.flamegraph_pl and not _path_exists(self.flamegraph_pl):
             raise FileNotFoundError(
                 f"flamegraph.pl not found at: {self.flamegraph_pl}")
     
-    def auto_detect_metadata(self, input_path: str) -> Dict[str, str]:
-        """Auto-detect benchmark name and type from path."""
-        path = Path(input_path)
-        stem = path.stem  # filename without extension
-        parent = path.parent.name
-        
-        metadata = {
-            'benchmark': 'unknown',
-            'trace_type': 'unknown'
-        }
-        
-        # Try to extract benchmark name from directory
-        if parent.startswith('out_'):
-            # e.g., out_dhrystone_dhrystone -> dhrystone
-            parts = parent.split('_')
-            if len(parts) >= 2:
-                metadata['benchmark'] = '_'.join(parts[1:])
-        
-        # Try to extract trace type from filename
-        if 'folded' in stem:
-            # e.g., callstack_folded_inst -> inst
-            parts = stem.split('_')
-            if 'folded' in parts:
-                idx = parts.index('folded')
-                if idx + 1 < len(parts):
-                    metadata['trace_type'] = parts[idx + 1]
-        
-        return metadata
-    
     def determine_output_path(self, input_path: str, 
                              output_path: Optional[str] = None) -> str:
         """Determine output file path."""
@@ -93,79 +198,175 @@ class FlameGraphWrapper:
             return output_path
         
         # Auto-generate output path
-        path = Path(input_path)
-        metadata = self.auto_detect_metadata(input_path)
-        
-        output_name = f"flamegraph_{metadata['trace_type']}.svg"
-        return str(path.parent / output_name)
+        return auto_output_path(input_path)
     
     def generate(self, input_path: str, output_path: Optional[str] = None,
                 config: Optional[FlameGraphConfig] = None) -> bool:
         """Generate flame graph from folded callstack."""
-        if not os.path.exists(input_path):
-            print(f"Error: Input file not found: {input_path}", 
-                  file=sys.stderr)
-            return False
+        success, log, errors = self.generate_logged(input_path, output_path,
+                                                    config)
+        sys.stdout.write(log)
+        sys.stderr.write(errors)
+        return success
+    
+    def generate_logged(self, input_path: str,
+                        output_path: Optional[str] = None,
+                        config: Optional[FlameGraphConfig] = None
+                        ) -> Tuple[bool, str, str]:
+        """Generate flame graph, returning (success, stdout log, errors).
+        
+        Messages are collected instead of printed so that each file's log
+        is written in one piece, also from parallel batch workers.
+        """
+        log: List[str] = []
+        errors: List[str] = []
         
-        # Setup config
+        # Open the input once; the handle goes to flamegraph.pl or the parser
+        try:
+            stacks = open(input_path, 'rb')
+        except FileNotFoundError:
+            errors.append(f"Error: Input file not found: {input_path}\n")
+            return False, '', ''.join(errors)
+        except OSError as e:
+            errors.append(f"Error: Cannot read input file {input_path}: {e}\n")
+            return False, '', ''.join(errors)
+        
+        # Setup config; copy so auto-detected titles don't leak across files
         if config is None:
             config = FlameGraphConfig()
+        else:
+            config = copy.copy(config)
         
-        # Auto-detect metadata for title/subtitle if not set
-        if not config.title or not config.subtitle:
-            metadata = self.auto_detect_metadata(input_path)
-            if not config.title:
-                config.title = metadata['benchmark']
-            if not config.subtitle:
-                config.subtitle = metadata['trace_type']
+        # Auto-detect only the title/subtitle fields that are not set
+        if not config.title:
+            config.title = detect_benchmark(input_path)
+        if not config.subtitle:
+            config.subtitle = detect_trace_type(input_path)
         
-        # Determine output path
+        # Determine output path; compressed output is written as .svgz
         output = self.determine_output_path(input_path, output_path)
-        
-        # Build command
-        cmd = ['perl', self.flamegraph_pl, input_path]
-        cmd.extend(config.to_args())
+        if config.compress and output.endswith('.svg'):
+            output += 'z'
+        compress = output.endswith('.svgz')
         
         # Execute
         try:
-            print(f"Generating flame graph...")
-            print(f"  Input:  {input_path}")
-            print(f"  Output: {output}")
-            print(f"  Title:  {config.title} - {config.subtitle}")
+            log.append(f"Generating flame graph...\n"
+                       f"  Input:  {input_path}\n"
+                       f"  Output: {output}\n"
+                       f"  Title:  {config.title} - {config.subtitle}\n")
+            
+            # Identical input and config give an identical graph
+            cached = None
+            if self.cache_dir is not None:
+                backend = self.flamegraph_pl or _NATIVE_BACKEND
+                key = _cache_key(stacks, backend, config)
+                cached = self.cache_dir / (key + ('.svgz' if compress
+                                                  else '.svg'))
+                if cached.exists():
+                    shutil.copyfile(cached, output)
+                    size = os.path.getsize(output)
+                    log.append(f"✓ Success! Copied cached {output} "
+                               f"({size:,} bytes)\n")
+                    return True, ''.join(log), ''.join(errors)
+            
+            if self.flamegraph_pl is None:
+                self.generate_native(stacks, output, config, compress)
+                if cached is not None:
+                    _store_cached(output, cached)
+                size = os.path.getsize(output)
+                log.append(f"✓ Success! Generated {output} ({size:,} bytes)\n")
+                return True, ''.join(log), ''.join(errors)
             
-            with open(output, 'w') as f:
-                result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE,
-                                       text=True)
+            # Build command; flamegraph.pl reads the stacks from stdin.
+            # An absolute perl path plus close_fds=False lets subprocess
+            # spawn it with posix_spawn instead of fork+exec.
+            cmd = [_find_perl(), self.flamegraph_pl]
+            cmd.extend(config.to_args())
+            
+            run_args = {'stderr': subprocess.PIPE, 'close_fds': False}
+            if config.prune > 0:
+                # Pipe the pruned stacks without a temporary file
+                run_args['input'] = prune_folded(stacks, config.prune)
+            else:
+                run_args['stdin'] = stacks
+            
+            if compress:
+                result = subprocess.run(cmd, stdout=subprocess.PIPE,
+                                        **run_args)
+                if result.returncode == 0:
+                    _write_output(output, result.stdout, compress)
+            else:
+                # perl writes the SVG bytes straight to the raw fd
+                with open(output, 'wb') as f:
+                    result = subprocess.run(cmd, stdout=f.fileno(),
+                                            **run_args)
             
             if result.returncode != 0:
-                print(f"Error: flamegraph.pl failed:", file=sys.stderr)
-                print(result.stderr, file=sys.stderr)
-                return False
+                errors.append("Error: flamegraph.pl failed:\n")
+                errors.append(result.stderr.decode('utf-8', 'replace') + "\n")
+                return False, ''.join(log), ''.join(errors)
+            
+            if cached is not None:
+                _store_cached(output, cached)
             
             # Get file size
             size = os.path.getsize(output)
-            print(f"✓ Success! Generated {output} ({size:,} bytes)")
-            return True
+            log.append(f"✓ Success! Generated {output} ({size:,} bytes)\n")
+            return True, ''.join(log), ''.join(errors)
             
         except Exception as e:
-            print(f"Error during generation: {e}", file=sys.stderr)
-            return False
+            errors.append(f"Error during generation: {e}\n")
+            return False, ''.join(log), ''.join(errors)
+        finally:
+            stacks.close()
+    
+    def generate_native(self, stacks: BinaryIO, output: str,
+                        config: FlameGraphConfig, compress: bool = False):
+        """Render the flame graph in-process with pyflamegraph."""
+        tree = read_folded(stacks, reverse=config.reverse)
+        if config.prune > 0:
+            tree.prune(config.prune * tree.total[0])
+        svg = emit_svg(tree, config, use_numba=self.use_numba)
+        _write_output(output, svg, compress)
     
     def batch_generate(self, input_files: List[str], 
                       config: Optional[FlameGraphConfig] = None) -> int:
-        """Generate flame graphs for multiple input files."""
+        """Generate flame graphs for multiple input files in parallel."""
         success_count = 0
         
-        for i, input_file in enumerate(input_files, 1):
-            print(f"\n[{i}/{len(input_files)}] Processing {input_file}")
-            if self.generate(input_file, config=config):
-                success_count += 1
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {
+                executor.submit(self.generate_logged, input_file, None,
+                                config): input_file
+                for input_file in input_files
+            }
+            # Each worker's log is written as one block, in completion order
+            for i, future in enumerate(as_completed(futures), 1):
+                success, log, errors = future.result()
+                sys.stdout.write(f"\n[{i}/{len(input_files)}] "
+                                 f"Finished {futures[future]}\n{log}")
+                sys.stdout.flush()
+                sys.stderr.write(errors)
+                if success:
+                    success_count += 1
         
         return success_count
 
 
+@functools.cache
+def _path_exists(path: str) -> bool:
+    return os.path.exists(path)
+
+
+@functools.cache
+def _find_perl() -> str:
+    return shutil.which('perl') or 'perl'
+
+
+@functools.cache
 def find_flamegraph_pl() -> Optional[str]:
-    """Find flamegraph.pl in common locations."""
+    """Find flamegraph.pl in common locations (resolved once)."""
     script_dir = Path(__file__).parent
     
     # Search paths
@@ -176,7 +377,7 @@ def find_flamegraph_pl() -> Optional[str]:
     ]
     
     for candidate in candidates:
-        if candidate.exists():
+        if _path_exists(str(candidate)):
             return str(candidate)
     
     return None
@@ -210,6 +411,17 @@ Examples:
                        help='Output SVG file (only for single input)')
     parser.add_argument('--flamegraph-pl', 
                        help='Path to flamegraph.pl (auto-detected if not specified)')
+    parser.add_argument('--native', action='store_true',
+                       help='Render with the built-in Python emitter instead '
+                            'of flamegraph.pl')
+    parser.add_argument('--numba', action='store_true',
+                       help='JIT-compile the native layout pass with numba')
+    parser.add_argument('--compress', action='store_true',
+                       help='Write gzip-compressed .svgz output')
+    parser.add_argument('--cache', action='store_true',
+                       help='Reuse graphs cached under '
+                            '~/.cache/rv32emu-flamegraph (entries are never '
+                            'evicted; delete the directory to reclaim space)')
     
     # Graph customization
     parser.add_argument('--title', help='Graph title')
@@ -222,6 +434,9 @@ Examples:
                        default='hot', help='Color scheme (default: hot)')
     parser.add_argument('--minwidth', default='0.1',
                        help='Minimum frame width (default: 0.1)')
+    parser.add_argument('--prune', type=float, default=0.0,
+                       help='Fold stacks below this fraction of all samples '
+                            'before rendering, e.g. 0.001 (default: 0, off)')
     
     # Graph options
     parser.add_argument('--reverse', action='store_true',
@@ -231,15 +446,18 @@ Examples:
     
     args = parser.parse_args()
     
-    # Find flamegraph.pl
-    flamegraph_pl = args.flamegraph_pl or find_flamegraph_pl()
-    if not flamegraph_pl:
-        print("Error: Cannot find flamegraph.pl", file=sys.stderr)
-        print("Please specify path with --flamegraph-pl", file=sys.stderr)
-        sys.exit(1)
+    # Find flamegraph.pl, falling back to the native emitter
+    flamegraph_pl = None
+    if not args.native:
+        flamegraph_pl = args.flamegraph_pl or find_flamegraph_pl()
+        if not flamegraph_pl:
+            print("Warning: Cannot find flamegraph.pl, using native emitter",
+                  file=sys.stderr)
     
     # Create wrapper
-    wrapper = FlameGraphWrapper(flamegraph_pl)
+    cache_dir = default_cache_dir() if args.cache else None
+    wrapper = FlameGraphWrapper(flamegraph_pl, use_numba=args.numba,
+                                cache_dir=cache_dir)
     
     # Setup config
     config = FlameGraphConfig()
@@ -251,6 +469,8 @@ Examples:
     config.height = args.height
     config.color = args.color
     config.minwidth = args.minwidth
+    config.prune = args.prune
+    config.compress = args.compress
     config.reverse = args.reverse
     config.inverted = args.inverted
     
@@ -4,11 +4,21 @@ from __future__ import annotations
 
 import argparse
 import csv
+import functools
+import io
+import itertools
+import multiprocessing
 import os
 import sys
-from collections import Counter
-from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter, defaultdict
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # optional; build_flat falls back to list.sort()
+    np = None
+
 
 
 @dataclass(frozen=True)
@@ -22,22 +32,69 @@ class FlatRow:
     total_time: Optional[float] = None  # total counts * sample time
 
 
-def _read_lines(path: str) -> List[str]:
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        return f.readlines()
-"""
-callstack_folded_inst.txt:
-_start; 4
-_start;memset; 720
-_start;main;Proc0; 80000018
-
-return:
-[
-    "_start; 4\n",
-    "_start;memset; 720\n", 
-    "_start;main;Proc0; 80000018\n"
-]
-"""
+def _tolist(col: Sequence) -> list:
+    return col.tolist() if hasattr(col, "tolist") else list(col)
+
+
+@dataclass(frozen=True)
+class FlatCols:
+    """
+    Column-wise flat profile, sorted by self desc then symbol asc.
+    Columns are numpy arrays when numpy is available, lists otherwise.
+    """
+    symbol: List[str]
+    self_count: Sequence[int]
+    total_count: Sequence[int]
+    percent: Sequence[float]
+    cum_percent: Sequence[float]
+    self_time: Optional[Sequence[float]] = None  # None when no clock was given
+    total_time: Optional[Sequence[float]] = None
+
+    def __len__(self) -> int:
+        return len(self.symbol)
+
+    def head(self, n: int) -> FlatCols:
+        return replace(
+            self,
+            symbol=self.symbol[:n],
+            self_count=self.self_count[:n],
+            total_count=self.total_count[:n],
+            percent=self.percent[:n],
+            cum_percent=self.cum_percent[:n],
+            self_time=None if self.self_time is None else self.self_time[:n],
+            total_time=None if self.total_time is None else self.total_time[:n],
+        )
+
+    def rows(self) -> List[FlatRow]:
+        n = len(self.symbol)
+        self_s = [None] * n if self.self_time is None else _tolist(self.self_time)
+        total_s = [None] * n if self.total_time is None else _tolist(self.total_time)
+        return list(
+            map(
+                FlatRow,
+                self.symbol,
+                _tolist(self.self_count),
+                _tolist(self.total_count),
+                _tolist(self.percent),
+                _tolist(self.cum_percent),
+                self_s,
+                total_s,
+            )
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[FlatRow]) -> FlatCols:
+        use_time = any(r.self_time is not None for r in rows)
+        return cls(
+            symbol=[r.symbol for r in rows],
+            self_count=[r.self_count for r in rows],
+            total_count=[r.total_count for r in rows],
+            percent=[r.percent for r in rows],
+            cum_percent=[r.cum_percent for r in rows],
+            self_time=[r.self_time or 0.0 for r in rows] if use_time else None,
+            total_time=[r.total_time or 0.0 for r in rows] if use_time else None,
+        )
+
 
 def parse_folded_line(line: str) -> Optional[Tuple[List[str], int]]:
     s = line.strip()    #remove whitespace at the beginning and end
@@ -65,41 +122,286 @@ def parse_folded_line(line: str) -> Optional[Tuple[List[str], int]]:
     """    
 
 
-def accumulate(lines: Iterable[str]) -> Tuple[Counter, Counter, int]:
+@functools.lru_cache(maxsize=None)
+def _load_folded_accum(build: bool):
+    """
+    The Cython tally of _folded_accum.pyx, or None.
+    A prebuilt module is imported as is; only with build is a missing one
+    compiled through pyximport, whose import alone costs a few hundred ms.
     """
+    try:
+        from _folded_accum import accumulate_folded  # type: ignore
+        return accumulate_folded
+    except ImportError:
+        if not build:
+            return None
+    try:
+        import pyximport  # type: ignore
+
+        hooks = pyximport.install(language_level=3)
+        try:
+            from _folded_accum import accumulate_folded  # type: ignore
+        finally:
+            pyximport.uninstall(*hooks)
+        return accumulate_folded
+    except Exception:  # ImportError, or a failed build
+        return None
+
+
+def accumulate(path: str, *, build_ext: bool = False) -> Tuple[Counter, Counter, int]:
+    """
+    Stream the folded trace at path line by line.
     Returns (self_counts, total_counts, total_samples)
     """
-    self_counts: Dict[str, int] = {}
-    total_counts: Dict[str, int] = {}
+    rest = 0
+    accumulate_folded = _load_folded_accum(build_ext)
+    if accumulate_folded is not None:
+        tallies = accumulate_folded(path)
+        if tallies is not None:
+            self_counts, total_counts, total_samples, rest = tallies
+            if rest < 0:
+                return self_counts, total_counts, total_samples
+
+    # a large read buffer amortizes syscalls; memory stays O(symbols)
+    with open(path, "rb", buffering=1 << 20) as raw:
+        raw.seek(rest)  # the extension stopped at a line it does not handle
+        f = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+        tallies = _tally_lines(f)
+    if rest == 0:
+        return tallies
+    self_counts, total_counts = Counter(self_counts), Counter(total_counts)
+    self_counts.update(tallies[0])
+    total_counts.update(tallies[1])
+    return self_counts, total_counts, total_samples + tallies[2]
+    """
+    frames = ['_start', 'main', 'Proc0']
+    count = 100
+    self_counts = {..., 'Proc0': +100, ...}
+    total_counts = {..., '_start': +100, 'main': +100, 'Proc0': +100, ...}
+    total_samples += 100
+    """
+
+
+def _tally_lines(lines) -> Tuple[Dict[str, int], Dict[str, int], int]:
+    self_counts: Dict[str, int] = defaultdict(int)
+    total_counts: Dict[str, int] = defaultdict(int)
     total_samples = 0
 
     for line in lines:
-        parsed = parse_folded_line(line)   
-        if parsed is None:
+        s = line.strip()
+        if not s:
             continue
-        frames, count = parsed      # read the frame and count
-        total_samples += count      # total samples
 
-        leaf = frames[-1]
-        if leaf in self_counts:
-            self_counts[leaf] += count
-        else:
-            self_counts[leaf] = count
+        # fast path for "a;b;c; 42", inlined from parse_folded_line
+        sp = s.rfind(" ")
+        try:
+            count = int(s[sp + 1:])
+        except ValueError:
+            sp = -1
+        if sp > 0:
+            frames = s[:sp].rstrip().split(";")
+            if "" in frames:
+                frames = [f for f in frames if f]
+        if sp <= 0 or not frames:
+            # other separators or malformed lines (raises ValueError)
+            frames, count = parse_folded_line(line)
+        total_samples += count      # total samples
 
+        self_counts[frames[-1]] += count
         for frame in frames:
-            if frame in total_counts:
-                total_counts[frame] += count
-            else:
-                total_counts[frame] = count
+            total_counts[frame] += count
 
     return self_counts, total_counts, total_samples
+
+
+def _shard_bounds(path: str, n: int) -> List[Tuple[int, int]]:
     """
-    frames = ['_start', 'main', 'Proc0']
-    count = 100
-    self_counts = {..., 'Proc0': +100, ...}
-    total_counts = {..., '_start': +100, 'main': +100, 'Proc0': +100, ...}
-    total_samples += 100
+    Split the file at path into at most n byte ranges, each starting
+    right after a newline.
+    """
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as f:
+        for k in range(1, n):
+            f.seek(size * k // n)
+            f.readline()  # move to the start of the next line
+            pos = f.tell()
+            if starts[-1] < pos < size:
+                starts.append(pos)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+class _ShardReader(io.RawIOBase):
+    """Raw reader that stops at byte offset end of an unbuffered file."""
+
+    def __init__(self, f, start: int, end: int):
+        self._f = f
+        self._left = end - start
+        f.seek(start)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self._f.readinto(memoryview(b)[: min(len(b), self._left)])
+        self._left -= n
+        return n
+
+
+def _accum_shard(shard: Tuple[str, int, int]) -> Tuple[Dict[str, int], Dict[str, int], int]:
+    path, start, end = shard
+    with open(path, "rb", buffering=0) as f:
+        # streamed, so a worker holds one buffer rather than its whole shard;
+        # same decoding and newline handling as reading the file in text mode
+        raw = io.BufferedReader(_ShardReader(f, start, end), buffer_size=1 << 20)
+        text = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+        self_counts, total_counts, total_samples = _tally_lines(text)
+    return dict(self_counts), dict(total_counts), total_samples
+
+
+def accumulate_parallel(path: str, jobs: int) -> Tuple[Counter, Counter, int]:
     """
+    Same tallies as accumulate(), with the trace split on line boundaries
+    and each shard tallied in its own process.
+    """
+    shards = [(path, start, end) for start, end in _shard_bounds(path, max(1, jobs))]
+    if len(shards) <= 1:
+        return accumulate(path)
+
+    with multiprocessing.Pool(len(shards)) as pool:
+        results = pool.map(_accum_shard, shards)
+
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    total_samples = 0
+    for s_self, s_total, s_sum in results:
+        self_counts.update(s_self)
+        total_counts.update(s_total)
+        total_samples += s_sum
+    return self_counts, total_counts, total_samples
+
+
+_jit_tally = None
+
+
+def accumulate_numba(path: str) -> Tuple[Counter, Counter, int]:
+    """
+    Same tallies as accumulate(), computed by a numba kernel that walks the
+    memory-mapped trace bytes. Traces the kernel does not handle (tabs,
+    signed counts, malformed lines) are handed to accumulate().
+    """
+    global _jit_tally
+    try:
+        import numba  # type: ignore
+        import numpy as np  # type: ignore
+    except Exception as e:
+        raise RuntimeError("numba not available; install it or drop --numba") from e
+
+    if _jit_tally is None:
+        from numba import int64, uint64  # type: ignore
+
+        def kernel(data, size):
+            # open-addressing table keyed by the frame's FNV-1a hash; a hit is
+            # confirmed bytewise. slot row: length (0 = free), start, self, total.
+            # total_samples -1: fall back to accumulate(), -2: table too small
+            mask = size - 1
+            slot_hash = np.zeros(size, np.uint64)
+            slot = np.zeros((size, 4), np.int64)
+            nsym = 0
+            total_samples = 0
+            n = data.shape[0]
+            i = 0
+            while i < n:
+                e = i
+                while e < n and data[e] != 10:  # "\n"
+                    e += 1
+                s = i
+                i = e + 1
+                # strip the ASCII whitespace str.strip() removes
+                while s < e and (data[s] == 32 or 9 <= data[s] <= 13 or 28 <= data[s] <= 31):
+                    s += 1
+                while e > s and (data[e - 1] == 32 or 9 <= data[e - 1] <= 13 or 28 <= data[e - 1] <= 31):
+                    e -= 1
+                if s == e:
+                    continue
+                # str.strip() also removes non-ASCII whitespace (NBSP, U+3000,
+                # ...); a UTF-8 byte at a stripped edge goes to accumulate()
+                if data[s] >= 128:
+                    return slot, -1
+
+                # "...; 42": digits after the last space
+                sp = e
+                while sp > s and 48 <= data[sp - 1] <= 57:
+                    sp -= 1
+                if sp == e or sp == s or data[sp - 1] != 32 or e - sp > 18:
+                    return slot, -1
+                count = 0
+                for k in range(sp, e):
+                    count = count * 10 + (data[k] - 48)
+                end = sp - 1
+                # "\r" is kept: a lone one splits lines in text mode (see below)
+                while end > s and (data[end - 1] == 32 or 9 <= data[end - 1] <= 12 or 28 <= data[end - 1] <= 31):
+                    end -= 1
+                if end > s and data[end - 1] >= 128:
+                    return slot, -1
+
+                leaf = -1
+                f = s
+                while f < end:
+                    g = f
+                    h = uint64(14695981039346656037)
+                    while g < end and data[g] != 59:  # ";"
+                        if data[g] == 13:  # lone "\r": leave it to accumulate()
+                            return slot, -1
+                        h = (h ^ uint64(data[g])) * uint64(1099511628211)
+                        g += 1
+                    if g > f:
+                        pos = int64(h >> uint64(1)) & mask
+                        while slot[pos, 0] != 0:
+                            if slot_hash[pos] == h and slot[pos, 0] == g - f:
+                                o = slot[pos, 1]
+                                k = 0
+                                while k < g - f and data[o + k] == data[f + k]:
+                                    k += 1
+                                if k == g - f:
+                                    break
+                            pos = (pos + 1) & mask
+                        if slot[pos, 0] == 0:
+                            nsym += 1
+                            if 2 * nsym > size:
+                                return slot, -2
+                            slot_hash[pos] = h
+                            slot[pos, 0] = g - f
+                            slot[pos, 1] = f
+                        slot[pos, 3] += count
+                        leaf = pos
+                    f = g + 1
+                if leaf < 0:
+                    return slot, -1
+                slot[leaf, 2] += count
+                total_samples += count
+            return slot, total_samples
+        _jit_tally = numba.njit(cache=True)(kernel)
+
+    if os.path.getsize(path) == 0:
+        return accumulate(path)
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    size = 1 << 12
+    slot, total_samples = _jit_tally(data, size)
+    while total_samples == -2:
+        size <<= 2
+        slot, total_samples = _jit_tally(data, size)
+    if total_samples < 0:
+        return accumulate(path)  # line shape the kernel does not handle
+
+    self_counts: Dict[str, int] = defaultdict(int)
+    total_counts: Dict[str, int] = defaultdict(int)
+    for length, start, sc, tc in slot[slot[:, 0] > 0].tolist():
+        sym = data[start:start + length].tobytes().decode("utf-8", errors="replace")
+        if sc:
+            self_counts[sym] += sc
+        total_counts[sym] += tc
+    return self_counts, total_counts, total_samples
 
 
 def _unit_scale_seconds(x: float) -> Tuple[float, str]:
@@ -114,60 +416,56 @@ def _unit_scale_seconds(x: float) -> Tuple[float, str]:
     return x, "s"
 
 
-def build_flat(
+def build_flat_cols(
     self_counts: Counter,   # sysbol self count
     total_counts: Counter,  # symbol total count
     total_samples: int,    # total samples
     *,
     clk_mhz: Optional[float] = None,  # clock frequency in MHz
-) -> Tuple[List[FlatRow], Dict[str, object]]:
+) -> Tuple[FlatCols, Dict[str, object]]:
     if total_samples <= 0:
         raise ValueError("no samples")
 
-    rows = []
-    for sym, self_c in self_counts.items():
-        total_c = int(total_counts.get(sym, 0))  # get the total count of the symbol
-        rows.append((sym, int(self_c), total_c))  # construct tuple : [('symbol1', self count 1, total count 1), ...]
-
-    # sort by self desc, then name asc
-    rows.sort(key=lambda t: (-t[1], t[0]))  # sort the rows by self count descending, then symbol ascending
-
-    out: List[FlatRow] = []
-    cum = 0.0
-
     use_time = clk_mhz is not None and clk_mhz > 0.0
     # If this trace is "cycles", you can treat each count as one cycle.
     # With clk in MHz, cycles per second = clk * 1e6, so:
     # seconds = cycles / (clk*1e6)
     denom = (clk_mhz * 1e6) if use_time else None
 
-    for sym, self_c, total_c in rows:
-        pct = (float(self_c) / float(total_samples)) * 100.0 # self count / total samples
-        cum += pct
+    # sort by self desc, then name asc; columns are computed array-wise
+    if np is not None and self_counts:
+        syms = list(self_counts)
+        sc = np.fromiter((self_counts[s] for s in syms), dtype=np.int64, count=len(syms))
+        tc = np.fromiter((total_counts.get(s, 0) for s in syms), dtype=np.int64, count=len(syms))
+        # name order from sorted(), then a stable sort on self desc; an
+        # np.array of the names would be fixed-width (N x longest name)
+        by_name = sorted(range(len(syms)), key=syms.__getitem__)
+        by_name = np.fromiter(by_name, dtype=np.intp, count=len(syms))
+        order = by_name[np.argsort(-sc[by_name], kind="stable")]
+        sc, tc = sc[order], tc[order]
+        pct = sc / float(total_samples) * 100.0  # self count / total samples
+        syms = [syms[i] for i in order.tolist()]
+        self_c, total_c = sc, tc
+        pcts, cums = pct, np.cumsum(pct)
         if denom:
-            self_s = float(self_c) / denom
-            total_s = float(total_c) / denom
-            out.append(
-                FlatRow(
-                    symbol=sym,
-                    self_count=self_c,
-                    total_count=total_c,
-                    percent=pct,
-                    cum_percent=cum,
-                    self_time=self_s,
-                    total_time=total_s,
-                )
-            )
-        else:
-            out.append(
-                FlatRow(
-                    symbol=sym,
-                    self_count=self_c,
-                    total_count=total_c,
-                    percent=pct,
-                    cum_percent=cum,
-                )
-            )
+            self_s, total_s = sc / denom, tc / denom
+    else:
+        rows = []
+        for sym, c in self_counts.items():
+            rows.append((sym, int(c), int(total_counts.get(sym, 0))))  # construct tuple : [('symbol1', self count 1, total count 1), ...]
+        rows.sort(key=lambda t: (-t[1], t[0]))  # sort the rows by self count descending, then symbol ascending
+        syms = [r[0] for r in rows]
+        self_c = [r[1] for r in rows]
+        total_c = [r[2] for r in rows]
+        pcts = [(float(c) / float(total_samples)) * 100.0 for c in self_c]
+        cums = list(itertools.accumulate(pcts))
+        if denom:
+            self_s = [float(c) / denom for c in self_c]
+            total_s = [float(c) / denom for c in total_c]
+    if not denom:
+        self_s = total_s = None
+
+    out = FlatCols(syms, self_c, total_c, pcts, cums, self_s, total_s)
 
     meta: Dict[str, object] = {"total_samples": total_samples}
     if use_time and denom:
@@ -188,21 +486,59 @@ def build_flat(
     meta = {'total_samples': 80000743, 'clk_mhz': 100.0, 'total_time_s': 800007.43}
     """
 
+
+def build_flat(
+    self_counts: Counter,
+    total_counts: Counter,
+    total_samples: int,
+    *,
+    clk_mhz: Optional[float] = None,
+) -> Tuple[List[FlatRow], Dict[str, object]]:
+    cols, meta = build_flat_cols(self_counts, total_counts, total_samples, clk_mhz=clk_mhz)
+    return cols.rows(), meta
+
+
+def filter_rows_cols(
+    cols: FlatCols,
+    *,
+    top: Optional[int],
+    thr_percent: Optional[float],
+) -> int:
+    """
+    Number of leading rows of cols that pass top/thr; the kept rows are
+    always a prefix since percent is sorted descending.
+    """
+    n = len(cols) if top is None else min(len(cols), max(0, int(top)))
+    if thr_percent is not None:
+        pct = cols.percent[:n]
+        if np is not None and isinstance(pct, np.ndarray):
+            n = int(np.searchsorted(-pct, -thr_percent, side="right"))
+        else:
+            for i in range(n):
+                if pct[i] < thr_percent:
+                    n = i
+                    break
+    return n
+
 def filter_rows(
     rows: Sequence[FlatRow],
     *,
     top: Optional[int],  # for output top N rows
     thr_percent: Optional[float],  # for output rows with self% >= thr
 ) -> List[FlatRow]:
-    out = list(rows) # copy the rows
+    # rows come from build_flat sorted by self desc, so percent only falls:
+    # the scan stops at the first row below thr (or after top rows)
+    n = len(rows) if top is None else min(len(rows), max(0, int(top)))
     if thr_percent is not None:
-        out = [r for r in out if r.percent >= thr_percent]
-    if top is not None:
-        out = out[: max(0, int(top))]
-    return out
+        for i in range(n):
+            if rows[i].percent < thr_percent:
+                n = i
+                break
+    return list(rows[:n])
 
 
 def print_flat(rows: Sequence[FlatRow], meta: Dict[str, object]) -> None:
+    # the whole table is formatted first and written with one call
     use_time = any((r.self_time is not None) for r in rows)
     if use_time:
         # pick a unit based on the max self_time
@@ -213,27 +549,24 @@ def print_flat(rows: Sequence[FlatRow], meta: Dict[str, object]) -> None:
             f"{'%':>6} {'cum%':>8} {'self':>12} {'total':>12} "
             f"{'self['+unit+']':>12} {'total['+unit+']':>12}  symbol"
         )  # construct the header
-        print(header)
-        for r in rows:
-            st = (r.self_time or 0.0) * scale 
-            tt = (r.total_time or 0.0) * scale
-            print(
-                f"{r.percent:6.2f} {r.cum_percent:8.2f} "
-                f"{r.self_count:12d} {r.total_count:12d} "
-                f"{st:12.3f} {tt:12.3f}  {r.symbol}"
-            )
+        lines = [header]
+        lines.extend(
+            f"{r.percent:6.2f} {r.cum_percent:8.2f} "
+            f"{r.self_count:12d} {r.total_count:12d} "
+            f"{(r.self_time or 0.0) * scale:12.3f} {(r.total_time or 0.0) * scale:12.3f}  {r.symbol}"
+            for r in rows
+        )
     else:
         header = f"{'%':>6} {'cum%':>8} {'self':>12} {'total':>12}  symbol"
-        print(header)
-        for r in rows:
-            print(
-                f"{r.percent:6.2f} {r.cum_percent:8.2f} "
-                f"{r.self_count:12d} {r.total_count:12d}  {r.symbol}"
-            )
+        lines = [header]
+        lines.extend(
+            f"{r.percent:6.2f} {r.cum_percent:8.2f} "
+            f"{r.self_count:12d} {r.total_count:12d}  {r.symbol}"
+            for r in rows
+        )
 
-    for k in ("total_samples", "clk_mhz", "total_time_s"):
-        if k in meta:
-            print(f"{k}: {meta[k]}")
+    lines.extend(f"{k}: {meta[k]}" for k in ("total_samples", "clk_mhz", "total_time_s") if k in meta)
+    sys.stdout.write("\n".join(lines) + "\n")
 """
      %     cum%         self        total    self[ms]   total[ms]  symbol
 100.00   100.00     80000018     80000018       0.800       0.800   Proc0
@@ -246,8 +579,19 @@ total_time_s: 800007.43
 """
 
 def write_csv(rows: Sequence[FlatRow], path: str) -> None:
+    write_csv_cols(FlatCols.from_rows(rows), path)
+
+
+def write_csv_cols(cols: FlatCols, path: str) -> None:
+    # csv.writer rather than numpy.savetxt: symbols may need quoting
+    n = len(cols)
+    if cols.self_time is None:
+        self_s = total_s = [""] * n
+    else:
+        self_s = [f"{t:.12g}" for t in _tolist(cols.self_time)]
+        total_s = [f"{t:.12g}" for t in _tolist(cols.total_time)]
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as f:
+    with open(path, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
         w = csv.writer(f)
         w.writerow(
             [
@@ -260,21 +604,24 @@ def write_csv(rows: Sequence[FlatRow], path: str) -> None:
                 "total_time_s",
             ]
         )
-        for r in rows:
-            w.writerow(
-                [
-                    r.symbol,
-                    f"{r.percent:.6f}",
-                    f"{r.cum_percent:.6f}",
-                    r.self_count,
-                    r.total_count,
-                    "" if r.self_time is None else f"{r.self_time:.12g}",
-                    "" if r.total_time is None else f"{r.total_time:.12g}",
-                ]
+        w.writerows(
+            zip(
+                cols.symbol,
+                [f"{v:.6f}" for v in _tolist(cols.percent)],
+                [f"{v:.6f}" for v in _tolist(cols.cum_percent)],
+                _tolist(cols.self_count),
+                _tolist(cols.total_count),
+                self_s,
+                total_s,
             )
+        )
 
 
 def maybe_plot(rows: Sequence[FlatRow], path: str, title: str) -> None:
+    maybe_plot_cols([r.symbol for r in rows], [r.percent for r in rows], path, title)
+
+
+def maybe_plot_cols(labels: Sequence[str], values: Sequence[float], path: str, title: str) -> None:
     try:
         import matplotlib.pyplot as plt  # type: ignore
     except Exception as e:
@@ -282,10 +629,10 @@ def maybe_plot(rows: Sequence[FlatRow], path: str, title: str) -> None:
             "matplotlib not available; install it or skip --plot"
         ) from e
 
-    labels = [r.symbol for r in rows][::-1]
-    values = [r.percent for r in rows][::-1]
+    labels = list(labels)[::-1]
+    values = _tolist(values)[::-1]
 
-    fig_h = max(3.3, 0.33 * max(1, len(rows)))
+    fig_h = max(3.3, 0.33 * max(1, len(labels)))
     fig, ax = plt.subplots(1, 1, figsize=(7.5, fig_h), tight_layout=True)
     bars = ax.barh(labels, values, color="#7ed3ab")
     ax.bar_label(bars, fmt="%.1f%%", padding=3)
@@ -358,23 +705,22 @@ def combine_inst_cycle(
 
 
 def print_combined(rows: Sequence[Dict[str, object]], meta: Dict[str, object]) -> None:
-    print(
+    lines = [
         f"{'inst%':>7} {'cyc%':>7} {'inst_self':>10} {'inst_tot':>10} "
         f"{'cyc_self':>10} {'cyc_tot':>10} {'ipc':>8} {'cpi':>8}  symbol"
-    )
+    ]
     for r in rows:
         ipc = r["ipc"]
         cpi = r["cpi"]
-        print(
+        lines.append(
             f"{float(r['inst_percent']):7.2f} {float(r['cycle_percent']):7.2f} "
             f"{int(r['inst_self']):10d} {int(r['inst_total']):10d} "
             f"{int(r['cycle_self']):10d} {int(r['cycle_total']):10d} "
             f"{'' if ipc is None else f'{ipc:.3f}':>8} "
             f"{'' if cpi is None else f'{cpi:.3f}':>8}  {r['symbol']}"
         )
-    for k, v in meta.items():
-        if v is not None:
-            print(f"{k}: {v}")
+    lines.extend(f"{k}: {v}" for k, v in meta.items() if v is not None)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
@@ -401,6 +747,24 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         default=None,
         help="If set, compute time assuming counts are cycles and clk is MHz",
     )
+    p.add_argument(
+        "--numba",
+        action="store_true",
+        help="Tally the trace with a numba-compiled kernel (requires numba)",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Tally the trace in this many processes (ignored with --numba)",
+    )
+    p.add_argument(
+        "--build-ext",
+        action="store_true",
+        help="Compile _folded_accum.pyx with pyximport if no prebuilt module is found "
+        "(requires Cython and a C compiler)",
+    )
     p.add_argument("--csv", default=None, help="Write flat summary as CSV to this path")
     p.add_argument("--plot", action="store_true", help="Save a bar chart PNG (requires matplotlib)")
     p.add_argument(
@@ -433,16 +797,21 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         print(f"trace not found: {args.trace}", file=sys.stderr)
         return 2
 
-    t_self, t_total, t_sum = accumulate(_read_lines(args.trace))
-    t_rows, t_meta = build_flat(t_self, t_total, t_sum, clk_mhz=args.clk_mhz)
-    t_rows = filter_rows(t_rows, top=args.top, thr_percent=args.thr)
-
+    if args.numba:
+        tally = accumulate_numba
+    elif args.jobs > 1:
+        tally = functools.partial(accumulate_parallel, jobs=args.jobs)
+    else:
+        tally = functools.partial(accumulate, build_ext=args.build_ext)
+    t_self, t_total, t_sum = tally(args.trace)
     if args.second_trace:
         if not os.path.isfile(args.second_trace):
             print(f"second trace not found: {args.second_trace}", file=sys.stderr)
             return 2
 
-        s_self, s_total, s_sum = accumulate(_read_lines(args.second_trace))
+        s_self, s_total, s_sum = tally(args.second_trace)
+        t_rows, t_meta = build_flat(t_self, t_total, t_sum, clk_mhz=args.clk_mhz)
+        t_rows = filter_rows(t_rows, top=args.top, thr_percent=args.thr)
         s_rows, s_meta = build_flat(
             s_self, s_total, s_sum, clk_mhz=args.second_clk_mhz
         )
@@ -454,19 +823,23 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         print_combined(combined, meta)
         return 0
 
+    # single trace: stay column-wise and only build rows for what is printed
+    t_cols, t_meta = build_flat_cols(t_self, t_total, t_sum, clk_mhz=args.clk_mhz)
+    t_cols = t_cols.head(filter_rows_cols(t_cols, top=args.top, thr_percent=args.thr))
+
     title = f"Profile - {args.event}"
     print(title)
-    print_flat(t_rows, t_meta)
+    print_flat(t_cols.rows(), t_meta)
 
     if args.csv:
-        write_csv(t_rows, args.csv)
+        write_csv_cols(t_cols, args.csv)
 
     if args.plot:
         png = args.png
         if not png:
             base, _ = os.path.splitext(args.trace)
             png = base + f"_flat_{args.event}.png"
-        maybe_plot(t_rows, png, title=title)
+        maybe_plot_cols(t_cols.symbol, t_cols.percent, png, title=title)
         print(f"plot saved: {png}")
 
     return 0
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""Native flame graph emitter for folded callstacks.
+
+Drop-in replacement for flamegraph.pl used by modify_flamegraph.py when
+Perl/flamegraph.pl is not available or --native is requested.
+"""
+
+import functools
+import mmap
+import os
+import re
+import zlib
+from array import array
+from typing import BinaryIO, Callable, Dict, List, Tuple
+
+
+# Layout tunables, same defaults as flamegraph.pl
+FONT_TYPE = 'Verdana'
+FONT_SIZE = 12
+FONT_WIDTH = 0.59   # average glyph width relative to FONT_SIZE
+FRAME_PAD = 1
+XPAD = 10
+YPAD1 = FONT_SIZE * 3          # room for the title
+YPAD2 = FONT_SIZE * 2 + 10     # room for the details line
+
+
+class FrameTree:
+    """Prefix tree of folded stacks stored as parallel arrays.
+
+    Node 0 is the root. The children of a node form a singly linked list
+    through first_child/next_sibling; frame names are kept as raw bytes
+    and interned to ids. _child maps (node << 32 | name_id) to the child
+    node, so adding a frame does not walk the sibling list.
+    """
+
+    def __init__(self):
+        self.parent = array('i', [-1])
+        self.first_child = array('i', [-1])
+        self.next_sibling = array('i', [-1])
+        self.name_id = array('i', [-1])
+        self.total = array('q', [0])
+        self.names: List[bytes] = []
+        self._names: Dict[bytes, int] = {}
+        self._child: Dict[int, int] = {}
+        self._labels: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.total)
+
+    def intern(self, name: bytes) -> int:
+        name_id = self._names.get(name)
+        if name_id is None:
+            name_id = self._names[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def _append(self, node: int, name_id: int) -> int:
+        child = len(self.total)
+        self.parent.append(node)
+        self.first_child.append(-1)
+        self.next_sibling.append(self.first_child[node])
+        self.name_id.append(name_id)
+        self.total.append(0)
+        self.first_child[node] = child
+        self._child[node << 32 | name_id] = child
+        return child
+
+    def add_stack(self, frames: List[bytes], count: int):
+        """Add `count` samples to the path root -> frames[0] -> ..."""
+        names = self._names
+        index = self._child
+        total = self.total
+        total[0] += count
+        node = 0
+        for frame in frames:
+            nid = names.get(frame)
+            if nid is None:
+                nid = self.intern(frame)
+            child = index.get(node << 32 | nid)
+            if child is None:
+                child = self._append(node, nid)
+            total[child] += count
+            node = child
+
+    def labels(self) -> List[str]:
+        """Decoded frame names by name id; each name is decoded once."""
+        labels = self._labels
+        for name in self.names[len(labels):]:
+            labels.append(name.decode('utf-8', 'replace'))
+        return labels
+
+    def name(self, node: int) -> str:
+        return self.labels()[self.name_id[node]]
+
+    def children(self, node: int) -> List[int]:
+        out = []
+        child = self.first_child[node]
+        while child != -1:
+            out.append(child)
+            child = self.next_sibling[child]
+        return out
+
+    def self_count(self, node: int) -> int:
+        """Samples where `node` is the leaf frame."""
+        return self.total[node] - sum(self.total[c]
+                                      for c in self.children(node))
+
+    def prune(self, threshold: float, node: int = 0):
+        """Fold subtrees below threshold samples into a '<pruned>' child."""
+        # Explicit stack: deep emulator traces would overflow recursion
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            pruned = 0
+            prev = -1
+            child = self.first_child[node]
+            while child != -1:
+                nxt = self.next_sibling[child]
+                if self.total[child] < threshold:
+                    # Unlink; the arrays keep the dead entries
+                    pruned += self.total[child]
+                    del self._child[node << 32 | self.name_id[child]]
+                    if prev == -1:
+                        self.first_child[node] = nxt
+                    else:
+                        self.next_sibling[prev] = nxt
+                else:
+                    stack.append(child)
+                    prev = child
+                child = nxt
+
+            if pruned:
+                stub = self._append(node, self.intern(b'<pruned>'))
+                self.total[stub] = pruned
+
+
+def read_folded(f: BinaryIO, reverse: bool = False) -> FrameTree:
+    """Aggregate an open (binary) folded callstack file into a FrameTree.
+
+    The file is memory-mapped and parsed as bytes; frame names are only
+    decoded when a graph is emitted.
+    """
+    tree = FrameTree()
+    if os.fstat(f.fileno()).st_size == 0:
+        return tree
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b''):
+            # int() ignores the trailing newline of the count
+            stack, _, count = line.rpartition(b' ')
+            if not stack:
+                continue
+            frames = [frame for frame in stack.split(b';') if frame]
+            if reverse:
+                frames.reverse()
+            tree.add_stack(frames, int(count))
+    return tree
+
+
+def load_folded(input_path: str, reverse: bool = False) -> FrameTree:
+    """Aggregate a folded callstack file into a FrameTree."""
+    with open(input_path, 'rb') as f:
+        return read_folded(f, reverse)
+
+
+def dump_folded(tree: FrameTree) -> bytes:
+    """Serialize a FrameTree back to folded callstack lines."""
+    lines = []
+    stack = [(child, b'') for child in tree.children(0)]
+    while stack:
+        node, prefix = stack.pop()
+        path = prefix + tree.names[tree.name_id[node]]
+        self_count = tree.self_count(node)
+        if self_count:
+            lines.append(b'%s %d\n' % (path, self_count))
+        stack.extend((child, path + b';') for child in tree.children(node))
+    return b''.join(lines)
+
+
+# Color palettes, indexed by the flamegraph.pl --colors name. Each entry
+# holds the (r, g, b) expressions over three values v1, v2, v3 in [0, 1)
+# derived from the frame name; they are baked into compile_rect_emitter().
+_PALETTES: Dict[str, Tuple[str, str, str]] = {
+    'hot': ('205 + int(50 * v3)', 'int(230 * v1)', 'int(55 * v2)'),
+    'mem': ('0', '190 + int(50 * v2)', 'int(210 * v1)'),
+    'io': ('80 + int(60 * v1)', '80 + int(60 * v1)', '190 + int(55 * v2)'),
+    'red': ('200 + int(55 * v1)', '50 + int(80 * v1)', '50 + int(80 * v1)'),
+    'green': ('50 + int(60 * v1)', '200 + int(55 * v1)', '50 + int(60 * v1)'),
+    'blue': ('80 + int(60 * v1)', '80 + int(60 * v1)', '205 + int(50 * v1)'),
+    'yellow': ('175 + int(55 * v1)', '175 + int(55 * v1)',
+               '50 + int(20 * v1)'),
+    'purple': ('190 + int(65 * v1)', '80 + int(60 * v1)',
+               '190 + int(65 * v1)'),
+    'aqua': ('50 + int(60 * v1)', '165 + int(55 * v1)', '165 + int(55 * v1)'),
+    'orange': ('190 + int(65 * v1)', '90 + int(65 * v1)', '0'),
+}
+
+# Multi palettes pick one of the palettes above per frame name, following
+# the annotation and naming rules of flamegraph.pl's color().
+_JAVA_PACKAGE = re.compile(r'L?(java|javax|jdk|net|org|com|io|sun)/')
+_JS_SOURCE = re.compile(r'/.*\.js')
+
+
+def _java_palette(name: str) -> str:
+    if name.endswith('_[j]'):       # JIT annotation
+        return 'green'
+    if name.endswith('_[i]'):       # inline annotation
+        return 'aqua'
+    if _JAVA_PACKAGE.match(name) or ':::' in name:
+        return 'green'
+    if '::' in name:                # C++
+        return 'yellow'
+    if name.endswith('_[k]'):       # kernel annotation
+        return 'orange'
+    return 'red'
+
+
+def _perl_palette(name: str) -> str:
+    if '::' in name:                # C++
+        return 'yellow'
+    if 'Perl' in name or '.pl' in name:
+        return 'green'
+    if name.endswith('_[k]'):       # kernel
+        return 'orange'
+    return 'red'
+
+
+def _js_palette(name: str) -> str:
+    if name.endswith('_[j]'):       # JIT: source or builtin
+        return 'green' if '/' in name else 'aqua'
+    if '::' in name:                # C++
+        return 'yellow'
+    if _JS_SOURCE.search(name):
+        return 'green'
+    if ':' in name:                 # builtin
+        return 'aqua'
+    if name == ' ':                 # missing symbol
+        return 'green'
+    if '_[k]' in name:              # kernel
+        return 'orange'
+    return 'red'
+
+
+def _chain_palette(name: str) -> str:
+    return 'aqua' if '_[w]' in name else 'blue'   # waker / off-CPU
+
+
+_MULTI_PALETTES: Dict[str, Callable[[str], str]] = {
+    'java': _java_palette,
+    'perl': _perl_palette,
+    'js': _js_palette,
+    'wakeup': lambda name: 'aqua',
+    'chain': _chain_palette,
+}
+
+_RECT_SOURCE = '''
+def emit_rect(x, y, w, name, count, pct, out):
+    fill = colors.get(name)
+    if fill is None:
+        h = crc32(name.encode('utf-8'))
+        v1 = (h & 0xff) / 256
+        v2 = ((h >> 8) & 0xff) / 256
+        v3 = ((h >> 16) & 0xff) / 256
+        fill = colors[name] = {fill}
+    label = escape(name)
+    chars = int(w / {char_width!r})
+    if chars < 3:
+        text = ''
+    elif chars < len(name):
+        text = escape(name[:chars - 2]) + '..'
+    else:
+        text = label
+    out.append(
+        f'<g>\\n<title>{{label}} ({{count:,}} samples, {{pct:.2f}}%)</title>'
+        f'<rect x="{{x:.1f}}" y="{{y}}" width="{{w:.1f}}" height="{rect_h}" '
+        f'fill="{{fill}}" rx="2" ry="2" />\\n'
+        f'<text x="{{x + 3:.2f}}" y="{{y + {text_dy!r}:.1f}}">{{text}}</text>'
+        '\\n</g>\\n'
+    )
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def compile_rect_emitter(height: int, color: str) -> Callable:
+    """Generate emit_rect(x, y, w, name, count, pct, out) for one config.
+
+    Frame height, text offsets and the color palette are compiled in as
+    constants, so the per-rectangle work is a single formatted append.
+    Multi palettes (java, js, ...) choose a palette per frame name.
+    """
+    if color in _PALETTES:
+        fill = "'rgb(%%d,%%d,%%d)' %% (%s, %s, %s)" % _PALETTES[color]
+        palettes = {}
+    elif color in _MULTI_PALETTES:
+        fill = 'palettes[classify(name)](v1, v2, v3)'
+        palettes = {
+            base: eval("lambda v1, v2, v3: 'rgb(%%d,%%d,%%d)' %% (%s, %s, %s)"
+                       % exprs)
+            for base, exprs in _PALETTES.items()
+        }
+    else:
+        raise ValueError(f'unknown color palette: {color!r}')
+    source = _RECT_SOURCE.format(
+        fill=fill,
+        char_width=FONT_SIZE * FONT_WIDTH,
+        rect_h=f'{height - FRAME_PAD:.1f}',
+        text_dy=height / 2 + 4.5,
+    )
+    namespace = {'crc32': zlib.crc32, 'escape': _escape, 'colors': {},
+                 'palettes': palettes,
+                 'classify': _MULTI_PALETTES.get(color)}
+    exec(compile(source, f'<emit_rect {color} {height}>', 'exec'), namespace)
+    return namespace['emit_rect']
+
+
+def _escape(text: str) -> str:
+    return (text.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('"', '&quot;'))
+
+
+def _layout(parent, total, x):
+    """Fill x[] with the left offset (in samples) of each preorder node."""
+    cursor = [0] * len(parent)
+    for i in range(1, len(parent)):
+        p = parent[i]
+        x[i] = cursor[p]
+        cursor[p] += total[i]
+        cursor[i] = x[i]
+
+
+_jit_layout = None
+
+
+def _numba_layout(parent: List[int], total: List[int]) -> List[int]:
+    """Run _layout compiled by numba over numpy arrays."""
+    global _jit_layout
+    try:
+        import numba  # type: ignore
+        import numpy as np  # type: ignore
+    except Exception as e:
+        raise RuntimeError(
+            "numba not available; install it or drop --numba") from e
+
+    if _jit_layout is None:
+        def kernel(parent, total, x):
+            cursor = np.zeros(parent.shape[0], dtype=np.int64)
+            for i in range(1, parent.shape[0]):
+                p = parent[i]
+                x[i] = cursor[p]
+                cursor[p] += total[i]
+                cursor[i] = x[i]
+        _jit_layout = numba.njit(cache=True)(kernel)
+
+    x = np.zeros(len(parent), dtype=np.int64)
+    _jit_layout(np.asarray(parent, dtype=np.int64),
+                np.asarray(total, dtype=np.int64), x)
+    return x.tolist()
+
+
+def emit_svg(tree: FrameTree, cfg, use_numba: bool = False) -> bytes:
+    """Render a FrameTree as a flame graph SVG.
+
+    `cfg` is a FlameGraphConfig; title, subtitle, width, height, color,
+    minwidth and inverted are honoured.
+    """
+    total_samples = tree.total[0]
+    if total_samples <= 0:
+        raise ValueError('no stack counts found')
+
+    width = cfg.width
+    frame_height = cfg.height
+    widthpertime = (width - 2 * XPAD) / total_samples
+    minwidth = str(cfg.minwidth)
+    if minwidth.endswith('%'):
+        min_samples = total_samples * float(minwidth[:-1]) / 100
+    else:
+        min_samples = float(minwidth) / widthpertime
+
+    # Flatten the visible part of the tree in preorder; children are
+    # sorted by name like flamegraph.pl does for the merged stacks.
+    names = ['all']
+    parent = [-1]
+    total = [total_samples]
+    depth = [0]
+
+    def visible_children(node: int) -> List[int]:
+        children = [c for c in tree.children(node)
+                    if tree.total[c] >= min_samples]
+        children.sort(key=tree.name, reverse=True)
+        return children
+
+    stack = [(child, 0, 1) for child in visible_children(0)]
+    while stack:
+        node, index, level = stack.pop()
+        names.append(tree.name(node))
+        parent.append(index)
+        total.append(tree.total[node])
+        depth.append(level)
+        index = len(names) - 1
+        stack.extend((child, index, level + 1)
+                     for child in visible_children(node))
+
+    if use_numba:
+        x = _numba_layout(parent, total)
+    else:
+        x = [0] * len(parent)
+        _layout(parent, total, x)
+
+    max_depth = max(depth)
+    image_height = (max_depth + 1) * frame_height + YPAD1 + YPAD2
+    if cfg.subtitle:
+        image_height += FONT_SIZE * 2
+    title = cfg.title or ('Icicle Graph' if cfg.inverted else 'Flame Graph')
+    top = YPAD1 + (FONT_SIZE * 2 if cfg.subtitle else 0)
+
+    out = [
+        '<?xml version="1.0" standalone="no"?>\n'
+        '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" '
+        '"http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">\n'
+        f'<svg version="1.1" width="{width}" height="{image_height}" '
+        f'viewBox="0 0 {width} {image_height}" '
+        'xmlns="http://www.w3.org/2000/svg">\n'
+        f'<style type="text/css">text {{ font-family:{FONT_TYPE}; '
+        f'font-size:{FONT_SIZE}px; fill:rgb(0,0,0); }}</style>\n'
+        f'<rect x="0.0" y="0" width="{width}" height="{image_height}" '
+        'fill="rgb(245,245,245)" />\n'
+        f'<text x="{width / 2:.2f}" y="{FONT_SIZE * 2}" '
+        f'text-anchor="middle" style="font-size:{FONT_SIZE + 5}px">'
+        f'{_escape(title)}</text>\n'
+    ]
+    if cfg.subtitle:
+        out.append(f'<text x="{width / 2:.2f}" y="{FONT_SIZE * 4}" '
+                   'text-anchor="middle" style="fill:rgb(160,160,160)">'
+                   f'{_escape(cfg.subtitle)}</text>\n')
+
+    emit_rect = cfg.compile_emitter()
+    pct_scale = 100.0 / total_samples
+    for i, name in enumerate(names):
+        if cfg.inverted:
+            y1 = top + depth[i] * frame_height
+        else:
+            y1 = image_height - YPAD2 - (depth[i] + 1) * frame_height
+        emit_rect(XPAD + x[i] * widthpertime, y1, total[i] * widthpertime,
+                  name, total[i], total[i] * pct_scale, out)
+
+    out.append('</svg>\n')
+    return ''.join(out).encode('utf-8')
@@ -1,6 +1,6 @@
 import os
 import argparse
-import pandas as pd
+import heapq
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
@@ -16,6 +16,11 @@ INSN_GROUPS = {
     'FP-Mem': {'color': '#a29bfe', 'insns': ['flw', 'fsw', 'fld', 'fsd']},
 }
 
+# Flattened once at load: instruction -> (group, color)
+_INSN_TO_GROUP = {insn: (group, info['color'])
+                  for group, info in INSN_GROUPS.items()
+                  for insn in info['insns']}
+
 """ Since the number is too large and the number on the bar chart with same height will overlap each other, 
     so I substitute 1,000,000 with M and 1,000 with K.
 """
@@ -35,10 +40,7 @@ def pct_format(pct):
     return f"{pct:.1f}%"
 
 def get_group_info(insn_name):
-    for group, info in INSN_GROUPS.items():
-        if insn_name in info['insns']:
-            return group, info['color']
-    return 'Other', '#bdc3c7'
+    return _INSN_TO_GROUP.get(insn_name, ('Other', '#bdc3c7'))
 
 def generate_png(prof_path, top_n):
     output_dir = "visualization"
@@ -50,8 +52,10 @@ def generate_png(prof_path, top_n):
         print(f"Error: {prof_path} not found.")
         return
 
-    # Analyze the data
+    # Analyze the data; groups are tallied while parsing. A .prof table is
+    # at most a few hundred rows, so plain dicts beat a DataFrame here.
     data = []
+    group_sums = {}
     with open(prof_path, 'r') as f:
         start_parsing = False
         for line in f:
@@ -64,25 +68,23 @@ def generate_png(prof_path, top_n):
                 name = parts[0].strip()
                 count = int(parts[1].strip())
                 group, color = get_group_info(name)
-                data.append({'Instruction': name, 'Group': group, 'Count': count, 'Color': color})
-
-    df = pd.DataFrame(data)
-    
+                data.append((name, count, color))
+                group_sums[group] = group_sums.get(group, 0) + count
 
     # Plot settings
     plt.style.use('ggplot')
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 14))
 
     # Use a pie chart to show the proportion of each type of instruction.
-    group_sums = df.groupby('Group')['Count'].sum()
-    group_colors = [INSN_GROUPS[g]['color'] if g in INSN_GROUPS else '#bdc3c7' for g in group_sums.index]
+    groups = sorted(group_sums)
+    group_colors = [INSN_GROUPS[g]['color'] if g in INSN_GROUPS else '#bdc3c7' for g in groups]
     
-    ax1.pie(group_sums, labels=group_sums.index, autopct=pct_format, startangle=140, colors=group_colors, explode=[0.05]*len(group_sums))
+    ax1.pie([group_sums[g] for g in groups], labels=groups, autopct=pct_format, startangle=140, colors=group_colors, explode=[0.05]*len(groups))
     ax1.set_title("Instruction Group Percentage", fontsize=16, fontweight='bold')
 
     # Use bar chart to show top N executed instruction
-    topn = df.sort_values(by='Count', ascending=False).head(top_n)
-    bars = ax2.bar(topn['Instruction'], topn['Count'], color=topn['Color'])
+    topn = heapq.nlargest(top_n, data, key=lambda d: d[1])
+    bars = ax2.bar([d[0] for d in topn], [d[1] for d in topn], color=[d[2] for d in topn])
     ax2.set_title(f"Top {top_n} Executed Instructions", fontsize=16, fontweight='bold')
     ax2.set_ylabel("Execution Count")
 
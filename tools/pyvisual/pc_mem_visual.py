@@ -2,8 +2,10 @@ import argparse
 import os
 import struct
 
+import matplotlib.colors as colors
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+import numpy as np
 import pandas as pd
 
 def hex_to_int(x):
@@ -18,6 +20,19 @@ def hex_to_int(x):
         except:
             return 0
 
+
+def hex_column(col):
+    """Apply hex_to_int to a whole column of strings.
+
+    Plain decimal columns are converted in one vectorized cast; otherwise
+    hex_to_int runs once per distinct value instead of once per cell.
+    """
+    try:
+        return col.astype('int64')
+    except (TypeError, ValueError):
+        col = col.fillna('')
+        return col.map({v: hex_to_int(v) for v in col.unique()})
+
 def read_trace_bin(bin_path):
     with open(bin_path, 'rb') as f:
         header = f.read(12)
@@ -27,21 +42,21 @@ def read_trace_bin(bin_path):
         if version != 1 or record_size not in (20, 24):
             raise ValueError("Unsupported trace version or record size.")
 
-        records = []
-        while True:
-            chunk = f.read(record_size)
-            if not chunk:
-                break
-            if len(chunk) != record_size:
-                raise ValueError("Truncated trace record.")
-            if record_size == 20:
-                cycle, pc, rec_type, addr = struct.unpack('<QIII', chunk)
-            else:
-                cycle, pc, rec_type, addr, _ = struct.unpack('<QIIII', chunk)
-            type_char = 'I' if rec_type == 1 else 'M' if rec_type == 2 else 'U'
-            records.append((cycle, pc, type_char, addr))
+        # Parse all records in one call; a 24-byte record carries padding
+        fields = [('cycle', '<u8'), ('pc', '<u4'), ('type', '<u4'), ('addr', '<u4')]
+        if record_size == 24:
+            fields.append(('pad', '<u4'))
+        if (os.fstat(f.fileno()).st_size - 12) % record_size:
+            raise ValueError("Truncated trace record.")
+        arr = np.fromfile(f, dtype=np.dtype(fields))
 
-    return pd.DataFrame(records, columns=['cycle', 'pc', 'type', 'addr'])
+    type_char = np.where(arr['type'] == 1, 'I', np.where(arr['type'] == 2, 'M', 'U'))
+    return pd.DataFrame({
+        'cycle': arr['cycle'].astype(np.int64),
+        'pc': arr['pc'].astype(np.int64),
+        'type': type_char,
+        'addr': arr['addr'].astype(np.int64),
+    })
 
 
 def plot_behavior(input_path):
@@ -55,43 +70,52 @@ def plot_behavior(input_path):
         if input_path.endswith('.bin'):
             df = read_trace_bin(input_path)
         else:
-            df = pd.read_csv(input_path, converters={
-                'pc': hex_to_int,
-                'addr': hex_to_int
-            })
+            df = pd.read_csv(input_path, dtype={'pc': str, 'addr': str})
+            df['pc'] = hex_column(df['pc'])
+            df['addr'] = hex_column(df['addr'])
     except Exception as e:
         print(f'Read Failed : {e}')
         return
 
     max_points = 500000
 
-    def downsample(df_in, limit):
-        if len(df_in) > limit:
-            step = max(1, len(df_in) // limit)
-            return df_in.iloc[::step].copy()
-        return df_in
+    def stride(n, limit):
+        # keep every step-th point so that at most ~limit remain
+        return max(1, n // limit) if n > limit else 1
+
+    # Work on plain numpy columns; only cycle/pc/addr are ever plotted
+    kind = df['type'].to_numpy()
+    cycle = df['cycle'].to_numpy()
+    insn = kind == 'I'
+    mem = kind == 'M'
+    insn_cycle = cycle[insn]
+    insn_pc = df['pc'].to_numpy()[insn]
+    mem_cycle = cycle[mem]
+    mem_addr = df['addr'].to_numpy()[mem]
+    # sort accesses by address once; every segment is then a contiguous slice
+    order = np.argsort(mem_addr, kind='stable')
+    mem_addr, mem_cycle = mem_addr[order], mem_cycle[order]
+    step = stride(len(insn_cycle), max_points)
+    insn_cycle, insn_pc = insn_cycle[::step], insn_pc[::step]
 
-    insn_all = df[df['type'] == 'I']
-    mem_all = df[df['type'] == 'M']
-    insn_df = downsample(insn_all, max_points)
     segments = []
-    if not mem_all.empty:
+    if mem_addr.size:
         low_max = 0x100000
         high_min = 0xFFFF0000
-        addr_min = int(mem_all['addr'].min())
-        addr_max = int(mem_all['addr'].max())
+        addr_min = int(mem_addr[0])
+        addr_max = int(mem_addr[-1])
 
         if addr_min <= low_max:
             segments.append(("Low (0x00000000-0x00100000)", 0, low_max))
         if addr_max >= high_min:
             segments.append(("High (0xFFFF0000-0xFFFFFFFF)", high_min, 0xFFFFFFFF))
 
-        low_mask = mem_all['addr'] <= low_max
-        high_mask = mem_all['addr'] >= high_min
-        mid_mask = ~(low_mask | high_mask)
-        if mid_mask.any():
-            mid_min = int(mem_all.loc[mid_mask, 'addr'].min())
-            mid_max = int(mem_all.loc[mid_mask, 'addr'].max())
+        # mid range is strictly between low_max and high_min
+        i0 = np.searchsorted(mem_addr, low_max, side='right')
+        i1 = np.searchsorted(mem_addr, high_min, side='left')
+        if i0 < i1:
+            mid_min = int(mem_addr[i0])
+            mid_max = int(mem_addr[i1 - 1])
             segments.append((f"Mid (0x{mid_min:08X}-0x{mid_max:08X})", mid_min, mid_max))
 
         if not segments:
@@ -108,7 +132,7 @@ def plot_behavior(input_path):
     hex_formatter = ticker.FuncFormatter(lambda x, p: f'0x{int(x):08X}')
 
     # Plotting PC-over-time
-    ax1.scatter(insn_df['cycle'], insn_df['pc'], s=1, c='blue', alpha=0.6)
+    ax1.scatter(insn_cycle, insn_pc, s=1, c='blue', alpha=0.6)
     ax1.set_ylabel("Program Counter (Hex)")
     ax1.set_title("PC-over-time Visualization")
     ax1.yaxis.set_major_formatter(hex_formatter)
@@ -116,19 +140,27 @@ def plot_behavior(input_path):
     ax1.set_xlabel("Execution Time (Cycles)")
 
     # Plotting Memory Access
-    if not mem_all.empty:
-        for ax, (label, lo, hi) in zip(mem_axes, segments):
-            seg_all = mem_all[(mem_all['addr'] >= lo) & (mem_all['addr'] <= hi)]
-            seg_df = downsample(seg_all, max_points)
-            if seg_df.empty:
-                continue
-            ax.scatter(seg_df['cycle'], seg_df['addr'], s=2, c='red', marker='x')
-            ax.set_ylabel("Memory Address (Hex)")
-            ax.set_title(f"Memory Access Patterns ({label})")
-            ax.yaxis.set_major_formatter(hex_formatter)
-            ax.set_ylim(lo, hi)
-            ax.grid(True, linestyle=':', alpha=0.5)
-            ax.set_xlabel("Execution Time (Cycles)")
+    # Accesses are binned into a 2D histogram, so drawing costs O(pixels)
+    # rather than one marker per access
+    for ax, (label, lo, hi) in zip(mem_axes, segments):
+        i0 = np.searchsorted(mem_addr, lo, side='left')
+        i1 = np.searchsorted(mem_addr, hi, side='right')
+        if i0 == i1:
+            continue
+        seg_cycle = mem_cycle[i0:i1]
+        seg_addr = mem_addr[i0:i1]
+        H, xe, ye = np.histogram2d(
+            seg_cycle, seg_addr, bins=(min(2000, len(seg_cycle)), 512),
+            range=[[seg_cycle.min(), max(seg_cycle.max(), seg_cycle.min() + 1)], [lo, max(hi, lo + 1)]])
+        ax.imshow(H.T, origin='lower', extent=[xe[0], xe[-1], ye[0], ye[-1]], aspect='auto',
+                  cmap='Reds', norm=colors.LogNorm(vmin=0.5, vmax=max(H.max(), 1)),
+                  interpolation='nearest')
+        ax.set_ylabel("Memory Address (Hex)")
+        ax.set_title(f"Memory Access Patterns ({label})")
+        ax.yaxis.set_major_formatter(hex_formatter)
+        ax.set_ylim(lo, hi)
+        ax.grid(True, linestyle=':', alpha=0.5)
+        ax.set_xlabel("Execution Time (Cycles)")
 
     # Manage the layout and save it as png.
     plt.tight_layout()
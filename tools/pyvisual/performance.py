@@ -1,81 +1,143 @@
-import matplotlib.pyplot as plt
+import mmap
 import numpy as np
-import re
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
+# repository root, resolved once; profiles are read from build/
+ROOT = Path(__file__).resolve().parents[2]
+BUILD_DIR = ROOT / 'build'
+VIS_DIR = ROOT / 'visualization'
 
-def parse_prof_files():
-    directory = os.path.abspath(os.path.join(script_dir, "..", "..", "build"))
-    data = []
+# Summary lines the emulator writes into each .prof file, in this order and
+# ahead of the (much longer) block dump, e.g. "Total Cycles: 1234"; each
+# line prefix maps to the record field and its parser
+SUMMARY_FIELDS = {
+    b"Total Cycles": ('cycles', int),
+    b"Total Instructions": ('instructions', int),
+    b"Average CPI": ('cpi', float),
+}
+
+# src/main.c always names profiles "<program>.prof"
+PROF_SUFFIXES = (".prof",)
+
+# CPI bar colors, repeated when there are more workloads than colors
+PALETTE = ('#f1c40f', '#2ecc71', '#9b59b6', '#e67e22')
+
+# One record per .prof file; parse_prof_files returns an array of these
+PROF_DTYPE = np.dtype([('name', object), ('cycles', 'i8'), ('instructions', 'i8'), ('cpi', 'f8')])
+
+def parse_one(entry):
+    """ Return the (name, cycles, instructions, cpi) record of one .prof file, or None. """
+    try:
+        fields = {}
+        # the summary is plain ASCII, so match bytes and skip decoding
+        with open(entry.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            # map the file instead of reading it; find() only touches the
+            # pages up to the summary lines
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                for head, (key, parse) in SUMMARY_FIELDS.items():
+                    start = mm.find(b"\n" + head + b":", pos)
+                    if start < 0:
+                        return None
+                    start += len(head) + 2
+                    pos = mm.find(b"\n", start)
+                    if pos < 0:
+                        pos = len(mm)
+                    fields[key] = parse(mm[start:pos].strip())
+    except (IsADirectoryError, ValueError):
+        return None
+
+    return (
+        entry.name.replace('.prof', ''),
+        fields['cycles'],
+        fields['instructions'],
+        fields['cpi']
+    )
 
-    if not os.path.exists(directory):
-        print(f"Error : Directory '{directory}' not found.")
-        return data
+def parse_prof_files():
+    if not BUILD_DIR.exists():
+        print(f"Error : Directory '{BUILD_DIR}' not found.")
+        return np.empty(0, dtype=PROF_DTYPE)
 
     # Search for all the files ending with '.prof' 
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        if os.path.isfile(filepath) and (filename.endswith(".prof") or "." not in filename):            
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                    cycles = re.search(r"Total Cycles:\s+(\d+)", content)
-                    instrs = re.search(r"Total Instructions:\s+(\d+)", content)
-                    cpi = re.search(r"Average CPI:\s+([\d.]+)", content)
-                    
-                    if cycles and instrs and cpi:
-                        data.append({
-                            'name': filename.replace('.prof', ''),
-                            'cycles': int(cycles.group(1)),
-                            'instructions': int(instrs.group(1)),
-                            'cpi': float(cpi.group(1))
-                        })
-            except (IsADirectoryError, UnicodeDecodeError):
-                continue
-    return data
-
-output_dir = os.path.abspath(os.path.join(script_dir, "..", "..", "visualization"))
+    # scandir entries carry the file type, so no extra stat per file
+    with os.scandir(BUILD_DIR) as it:
+        entries = [entry for entry in it if entry.name.endswith(PROF_SUFFIXES) and entry.is_file()]
+
+    # file reads release the GIL, so the files are parsed concurrently
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as ex:
+        rows = [row for row in ex.map(parse_one, entries) if row is not None]
+    return np.array(rows, dtype=PROF_DTYPE)
+
+# Figure reused by repeated plot_performance calls
+_FIG = _AX1 = _AX2 = None
 
 def plot_performance(data):
-    if not data:
+    global _FIG, _AX1, _AX2
+    # imported here so that callers of parse_prof_files alone skip pyplot
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Patch
+
+    if len(data) == 0:
         print("No valid .prof files found.")
         return
 
-    names = [d['name'] for d in data]
-    instructions = [d['instructions'] for d in data]
-    cycles = [d['cycles'] for d in data]
-    cpi = [d['cpi'] for d in data]
+    names = data['name'].tolist()
+    instructions = data['instructions']
+    cycles = data['cycles']
+    cpi = data['cpi']
 
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
+    if _FIG is None:
+        _FIG, (_AX1, _AX2) = plt.subplots(1, 2, figsize=(14, 6))
+        # fixed margins for the fixed figure size instead of tight_layout()
+        _FIG.subplots_adjust(left=0.06, right=0.98, top=0.93, bottom=0.08, wspace=0.15)
+    else:
+        _AX1.clear()
+        _AX2.clear()
+    fig, ax1, ax2 = _FIG, _AX1, _AX2
 
     # Left one shows the workload comparison
     x = np.arange(len(names))
     width = 0.35
-    ax1.bar(x - width/2, instructions, width, label='Instructions', color='#3498db')
-    ax1.bar(x + width/2, cycles, width, label='Cycles', color='#e74c3c')
+    # both series in one bar call, instructions/cycles interleaved per workload
+    series = (('Instructions', '#3498db'), ('Cycles', '#e74c3c'))
+    pos = np.repeat(x, 2) + np.tile([-width/2, width/2], len(x))
+    ax1.bar(pos, np.column_stack([instructions, cycles]).ravel(), width,
+            color=[c for _, c in series] * len(x))
     ax1.set_yscale('log')
+    # fixed decade ticks inside the data range, instead of LogLocator
+    # recomputing candidates on every draw
+    counts = np.concatenate([instructions, cycles])
+    counts = counts[counts > 0]
+    if counts.size:
+        decades = np.arange(np.ceil(np.log10(counts.min())), np.floor(np.log10(counts.max())) + 1)
+        if decades.size:
+            ax1.set_yticks(10.0 ** decades)
     ax1.set_xticks(x)
     ax1.set_xticklabels(names)
     ax1.set_title('Workload Scale (Log Scale)')
-    ax1.legend()
+    ax1.legend(handles=[Patch(facecolor=c, label=label) for label, c in series])
 
     # Left one represents "Average CPI" comparison
-    bars = ax2.bar(names, cpi, color=['#f1c40f', '#2ecc71', '#9b59b6', '#e67e22'][:len(names)])
+    bars = ax2.bar(names, cpi, color=[PALETTE[i % len(PALETTE)] for i in range(len(names))])
     ax2.set_title('Average CPI (Efficiency)')
     ax2.set_ylim(0, max(cpi) * 1.2)
-    
-    for bar in bars:
-        height = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width()/2., height, f'{height:.3f}', 
-                 ha='center', va='bottom', fontweight='bold')
-
-    output_path = os.path.join(output_dir, "performance_summary.png")
-    plt.tight_layout()
-    plt.savefig(output_path)
+    ax2.bar_label(bars, fmt='%.3f', fontweight='bold')
+
+    VIS_DIR.mkdir(parents=True, exist_ok=True)
+    output_path = VIS_DIR / "performance_summary.png"
+    # a small summary chart: low dpi and fast zlib level keep the write cheap
+    fig.savefig(output_path, dpi=80, pil_kwargs={'compress_level': 1})
     print(f"Successfully generated report from {len(names)} files.")
 
 if __name__ == "__main__":
+    # the report is only written to a file, so no GUI backend is needed
+    import matplotlib
+    matplotlib.use('Agg')
+
     prof_data = parse_prof_files()
     plot_performance(prof_data)
\ No newline at end of file